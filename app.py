@@ -10,15 +10,26 @@ All numbers in INR. Zero conversion needed.
 """
 
 import os
+import json
+import re
 import time
-import math
+import hashlib
 import logging
 import traceback
-from flask import Flask, request, jsonify
+import functools
+from types import MappingProxyType
+from threading import Lock, RLock, Thread
+from flask import Flask, request
 from flask_cors import CORS
+import ijson
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import yfinance as yf
-from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+from concurrent.futures import Future, ThreadPoolExecutor
 
 # ═══════ CONFIG ═══════
 app = Flask(__name__)
@@ -27,45 +38,122 @@ PORT = int(os.environ.get("PORT", 10000))
 
 # Indian Stock Market API (free, no key)
 ISMA_BASE = "https://military-jobye-haiqstudios-14f59639.koyeb.app"
+ISMA_STOCK_URL = f"{ISMA_BASE}/stock"
+ISMA_LIST_URL = f"{ISMA_BASE}/stock/list"
+ISMA_SEARCH_URL = f"{ISMA_BASE}/search"
 
 # EODHD (optional, for future upgrade)
 EODHD_KEY = os.environ.get("EODHD_API_KEY", "")
+EODHD_BASE = "https://eodhd.com/api"
+
+# Exchange suffixes accepted from clients; ISMA/EODHD want the plain symbol
+_SUFFIX_RE = re.compile(r"\.(NS|BO)$")
+
+# Shared pool for overlapping independent upstream calls (I/O-bound → threads).
+# Sized at 2x the gunicorn request threads: a cold fullstock holds two slots.
+executor = ThreadPoolExecutor(max_workers=2 * int(os.environ.get("GUNICORN_THREADS", 32)))
+# Seconds to wait on pooled upstream fetches; above ISMA's worst case
+# (3 attempts x 15s timeout + retry backoff)
+FETCH_TIMEOUT = 50
+
+# Cache warmer: quotes refresh every WARM_INTERVAL (kept below the quote TTL so
+# entries never lapse), financials every WARM_FIN_INTERVAL. WARM_INTERVAL=0 disables.
+HOT_SYMBOLS = [s.strip().upper() for s in os.environ.get(
+    "HOT_SYMBOLS",
+    "RELIANCE,TCS,HDFCBANK,ICICIBANK,INFY,BHARTIARTL,SBIN,ITC,LT,HINDUNILVR,"
+    "KOTAKBANK,AXISBANK,BAJFINANCE,MARUTI,SUNPHARMA,HCLTECH,TITAN,ASIANPAINT,WIPRO,NTPC",
+).split(",") if s.strip()]
+WARM_INTERVAL = int(os.environ.get("WARM_INTERVAL", 240))  # seconds
+WARM_FIN_INTERVAL = 86400  # seconds
+WARM_MAX_SYMBOLS = 50
+WARM_TOKEN = os.environ.get("WARM_TOKEN", "")  # POST /api/warm is disabled unless set
+
+# Shared HTTP session: keep-alive connection pool + light retry on gateway errors
+session = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=50,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504]),
+)
+session.mount("https://", _adapter)
+session.mount("http://", _adapter)
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 log = logging.getLogger("valuelens")
 
-# ═══════ CACHE ═══════
-cache = {}
-TTL = {"quote": 300, "financials": 86400, "search": 86400}  # seconds
 
+def clean_sym(s):
+    """Upper-case a symbol and strip a trailing .NS/.BO suffix."""
+    return _SUFFIX_RE.sub("", s.upper())
 
-def cached(key, ttl_type="quote"):
-    entry = cache.get(key)
-    if not entry:
-        return None
-    if time.time() - entry["t"] > TTL.get(ttl_type, 300):
-        del cache[key]
-        return None
-    return entry["d"]
 
+# ═══════ CACHE ═══════
+# Bounded per-namespace TTL caches; TTLs follow each source's data cadence.
+# Misses (bad symbol, upstream down) go to a short-lived "neg" namespace so
+# repeated requests don't hammer the upstreams.
+TTL = {"quote": 300, "financials": 90 * 86400, "search": 30 * 86400, "neg": 60}  # seconds
+caches = {
+    "quote": TTLCache(maxsize=5000, ttl=TTL["quote"]),
+    "financials": TTLCache(maxsize=5000, ttl=TTL["financials"]),
+    "search": TTLCache(maxsize=10000, ttl=TTL["search"]),
+    "neg": TTLCache(maxsize=10000, ttl=TTL["neg"]),
+}
+_cache_lock = RLock()
 
-def set_cache(key, data):
-    cache[key] = {"d": data, "t": time.time()}
+
+def cached(key, ttl_type="quote"):
+    """Return cached data (possibly a cached miss such as []) or None if absent."""
+    with _cache_lock:
+        hit = caches[ttl_type].get(key)
+        return hit if hit is not None else caches["neg"].get(key)
+
+
+def set_cache(key, data, ttl_type="quote", neg=False):
+    with _cache_lock:
+        caches["neg" if neg else ttl_type][key] = data
+
+
+# ═══════ SINGLE-FLIGHT ═══════
+# Concurrent callers for the same upstream key share one in-flight fetch
+_inflight = {}
+_inflight_lock = Lock()
+
+
+def single_flight(fn):
+    @functools.wraps(fn)
+    def wrapper(*args):
+        key = (fn.__name__,) + args
+        with _inflight_lock:
+            fut = _inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = _inflight[key] = Future()
+        if not leader:
+            return fut.result()
+        try:
+            fut.set_result(fn(*args))
+        except Exception as e:
+            fut.set_exception(e)
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+        return fut.result()
+    return wrapper
 
 
 # ═══════ LAYER 1: Indian Stock Market API ═══════
+@single_flight
 def fetch_isma(symbol):
     """Fetch real-time price data from Indian Stock Market API. Returns INR natively."""
     try:
         # Remove .NS/.BO suffix if present — ISMA uses plain symbols
-        clean = symbol.replace(".NS", "").replace(".BO", "")
-        url = f"{ISMA_BASE}/stock?symbol={clean}&res=num"
+        clean = clean_sym(symbol)
         log.info(f"[ISMA] Fetching {clean}")
-        resp = requests.get(url, timeout=15)
+        resp = session.get(ISMA_STOCK_URL, params={"symbol": clean, "res": "num"}, timeout=15)
         if resp.status_code != 200:
             log.warning(f"[ISMA] {resp.status_code} for {clean}")
             return None
-        data = resp.json()
+        data = loads_json(resp.content)
         if data.get("status") != "success":
             return None
         d = data.get("data", {})
@@ -90,15 +178,23 @@ def fetch_isma(symbol):
         return None
 
 
+# Defaults used by fullstock when ISMA has no data for a symbol
+ISMA_EMPTY = MappingProxyType({
+    "cmp": 0, "mcap_raw": 0, "pe": 0, "eps": 0,
+    "sector": "Unknown", "industry": "", "name": "",
+    "change": 0, "changePct": 0, "yearHigh": 0, "yearLow": 0,
+    "volume": 0, "bookValue": 0, "dividendYield": 0,
+})
+
+
 def search_isma(query):
     """Search stocks via Indian Stock Market API."""
     try:
-        url = f"{ISMA_BASE}/search?query={query}"
         log.info(f"[ISMA SEARCH] {query}")
-        resp = requests.get(url, timeout=10)
+        resp = session.get(ISMA_SEARCH_URL, params={"query": query}, timeout=10)
         if resp.status_code != 200:
             return []
-        data = resp.json()
+        data = loads_json(resp.content)
         if data.get("status") != "success":
             return []
         results = data.get("results", [])
@@ -116,49 +212,49 @@ def search_isma(query):
 
 
 # ═══════ LAYER 2: yfinance (Financial Statements) ═══════
+# Candidate income-statement row labels, in priority order
+REV_KEYS = ["Total Revenue", "Operating Revenue", "Revenue"]
+PAT_KEYS = ["Net Income", "Net Income Common Stockholders", "Net Income From Continuing Operations"]
+
+
+def _first_valid_row(inc, keys):
+    """Per column, the first non-NaN value among the rows named in keys (NaN if none)."""
+    pos = [i for i in inc.index.get_indexer(keys) if i >= 0]
+    if not pos:
+        return np.full(len(inc.columns), np.nan)
+    return inc.iloc[pos].bfill().iloc[0].to_numpy(dtype="float64")
+
+
+@single_flight
 def fetch_yfinance_financials(symbol):
     """Fetch income statements from yfinance. Returns Revenue & PAT in INR (Crores)."""
     try:
         ticker = symbol if "." in symbol else symbol + ".NS"
         log.info(f"[YFINANCE] Fetching financials for {ticker}")
-        t = yf.Ticker(ticker)
 
-        # Get annual income statement
-        inc = t.financials  # columns = dates, rows = line items
+        # Get annual income statement (pretty=True keeps the "Total Revenue"-style labels)
+        inc = yf.Ticker(ticker).get_income_stmt(freq="yearly", pretty=True)  # columns = dates
         if inc is None or inc.empty:
             log.warning(f"[YFINANCE] No financials for {ticker}")
             return None
 
-        years = []
-        for col in inc.columns:
-            year = str(col.year) if hasattr(col, "year") else str(col)[:4]
-            rev = 0
-            pat = 0
-
-            # Revenue: try multiple possible row names
-            for key in ["Total Revenue", "Operating Revenue", "Revenue"]:
-                if key in inc.index and not math.isnan(inc.at[key, col]):
-                    rev = float(inc.at[key, col])
-                    break
-
-            # PAT: try multiple possible row names
-            for key in ["Net Income", "Net Income Common Stockholders",
-                        "Net Income From Continuing Operations"]:
-                if key in inc.index and not math.isnan(inc.at[key, col]):
-                    pat = float(inc.at[key, col])
-                    break
-
-            years.append({
-                "year": year,
-                "rev": round(rev / 1e7, 2),  # INR → Crores
-                "pat": round(pat / 1e7, 2),  # INR → Crores
-            })
+        # Revenue / PAT: first non-NaN value per year across candidate row names
+        rev_vals = _first_valid_row(inc, REV_KEYS)
+        pat_vals = _first_valid_row(inc, PAT_KEYS)
+        if np.isnan(rev_vals).all() and np.isnan(pat_vals).all():
+            log.warning(f"[YFINANCE] No revenue/PAT rows for {ticker}")
+            return None
+        revs = (rev_vals / 1e7).round(2)  # INR → Crores
+        pats = (pat_vals / 1e7).round(2)  # INR → Crores
+        labels = [str(c.year) if hasattr(c, "year") else str(c)[:4] for c in inc.columns]
 
-        # Also try to get shares outstanding
-        info = t.info or {}
-        shares = info.get("sharesOutstanding", 0)
+        years = [
+            {"year": y, "rev": float(r) if r == r else 0.0, "pat": float(p) if p == p else 0.0}
+            for y, r, p in zip(labels, revs, pats)
+        ]
 
-        return {"years": years, "shares": shares}
+        # Shares are derived from MCap / CMP in fullstock; skip the slow t.info scrape
+        return {"years": years, "shares": 0}
     except Exception as e:
         log.error(f"[YFINANCE ERROR] {symbol}: {e}")
         log.error(traceback.format_exc())
@@ -166,20 +262,21 @@ def fetch_yfinance_financials(symbol):
 
 
 # ═══════ LAYER 3: EODHD (Future upgrade) ═══════
+@single_flight
 def fetch_eodhd_financials(symbol):
     """Fetch from EODHD if API key is available."""
     if not EODHD_KEY:
         return None
     try:
-        ticker = symbol.replace(".NS", "").replace(".BO", "") + ".NSE"
-        url = f"https://eodhd.com/api/fundamentals/{ticker}"
+        ticker = clean_sym(symbol) + ".NSE"
+        url = f"{EODHD_BASE}/fundamentals/{ticker}"
         params = {"api_token": EODHD_KEY, "fmt": "json", "filter": "Financials"}
         log.info(f"[EODHD] Fetching {ticker}")
-        resp = requests.get(url, params=params, timeout=20)
+        resp = session.get(url, params=params, timeout=20)
         if resp.status_code != 200:
             log.warning(f"[EODHD] {resp.status_code} for {ticker}")
             return None
-        data = resp.json()
+        data = loads_json(resp.content)
 
         # Parse income statements
         income = data.get("Financials", {}).get("Income_Statement", {}).get("yearly", {})
@@ -202,6 +299,27 @@ def fetch_eodhd_financials(symbol):
         return None
 
 
+def fetch_financials(symbol, refresh=False):
+    """Financial statements layer: EODHD first, then yfinance. Returns (fin, source).
+
+    refresh=True refetches past the cache; if that fails the cached statements are kept.
+    """
+    ck = f"fin:{symbol}"
+    c = cached(ck, "financials")
+    if c is not None and not refresh:
+        return c
+    fin = fetch_eodhd_financials(symbol)
+    if fin:
+        out = (fin, "eodhd")
+    else:
+        fin = fetch_yfinance_financials(symbol)
+        out = (fin, "yfinance" if fin else None)
+    if fin:
+        set_cache(ck, out, "financials")
+        return out
+    return c if c is not None else out
+
+
 # ═══════ HELPERS ═══════
 def calc_cagr(arr, field, n):
     """Calculate CAGR over n years from array of yearly data."""
@@ -211,14 +329,150 @@ def calc_cagr(arr, field, n):
     b = arr[n].get(field, 0)  # n years ago
     if not b or b <= 0 or not a or a <= 0:
         return None
-    return round((math.pow(a / b, 1 / n) - 1) * 100, 1)
+    return round(((a / b) ** (1.0 / n) - 1.0) * 100.0, 1)
+
+
+def loads_json(content):
+    """Parse an upstream body with orjson, falling back to stdlib json for NaN/Infinity tokens."""
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:
+        return json.loads(content)
+
+
+def ojsonify(obj):
+    """jsonify() replacement backed by orjson (faster, handles NaN/numpy natively)."""
+    return app.response_class(orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY),
+                              mimetype="application/json")
+
+
+# ═══════ FULLSTOCK ═══════
+def build_fullstock(sym, refresh_fin=False, warming=False):
+    """Fetch, merge and cache the full stock payload for a clean symbol."""
+    ck = f"full:{sym}"
+
+    # ── LAYER 1 + 2: Real-time data and financials, fetched concurrently ──
+    f_isma = executor.submit(fetch_isma, sym)
+    f_fin = executor.submit(fetch_financials, sym, refresh_fin)
+    deadline = time.monotonic() + FETCH_TIMEOUT  # one budget shared by both waits
+    try:
+        isma = f_isma.result(timeout=FETCH_TIMEOUT)
+    except Exception as e:
+        log.error(f"[ISMA TIMEOUT] {sym}: {e}")
+        isma = None
+    has_isma = isma is not None
+    isma = isma or ISMA_EMPTY
+    try:
+        fin, fin_source = f_fin.result(timeout=max(0, deadline - time.monotonic()))
+    except Exception as e:
+        log.error(f"[FINANCIALS TIMEOUT] {sym}: {e}")
+        fin, fin_source = None, None
+
+    # ── MERGE ──
+    cmp = isma["cmp"]
+    mcap_raw = isma["mcap_raw"]
+    mcap_cr = mcap_raw / 1e7 if mcap_raw > 1e6 else mcap_raw  # Handle if already in Cr
+    pe = isma["pe"]
+    eps = isma["eps"]
+
+    # Shares: derive from mcap and CMP
+    shr_cr = mcap_cr / cmp if cmp > 0 and mcap_cr > 0 else 0
+
+    # Financial data
+    years = fin["years"] if fin else []
+    latest_rev = years[0]["rev"] if years else 0
+    latest_pat = years[0]["pat"] if years else 0
+
+    result = {
+        "sym": sym,
+        "name": isma["name"] or sym,
+        "sec": isma["sector"],
+        "industry": isma["industry"],
+        "cmp": cmp,
+        "shr": round(shr_cr, 2),
+        "mcapCr": round(mcap_cr, 0),
+        "pe": pe,
+        "eps": eps,
+        "pat": latest_pat,
+        "rev": latest_rev,
+        "r3": calc_cagr(years, "rev", 3),
+        "r5": calc_cagr(years, "rev", 5),
+        "p3": calc_cagr(years, "pat", 3),
+        "p5": calc_cagr(years, "pat", 5),
+        "dayChange": isma["change"],
+        "dayChangePct": isma["changePct"],
+        "yearHigh": isma["yearHigh"],
+        "yearLow": isma["yearLow"],
+        "bookValue": isma["bookValue"],
+        "dividendYield": isma["dividendYield"],
+        "_source": {
+            "realtime": "isma" if has_isma else "none",
+            "financials": fin_source or "none",
+            "years_available": len(years),
+        },
+    }
+
+    log.info(
+        f"[RESULT] {sym}: CMP={cmp} MCap={round(mcap_cr)}Cr "
+        f"PE={pe} PAT={latest_pat}Cr Rev={latest_rev}Cr "
+        f"({len(years)} yrs from {fin_source or 'none'})"
+    )
+
+    # A warm rebuild that lost ISMA must not replace a good entry with zeros
+    if not (warming and not has_isma and cached(ck, "quote") is not None):
+        set_cache(ck, result, neg=not has_isma)
+    return result
+
+
+# ═══════ CACHE WARMER ═══════
+_warm_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-warm")
+_warm_started = False
+
+
+def warm_cache(symbols, refresh_fin=False):
+    """Rebuild full:<sym> entries so hot symbols are always served from cache.
+
+    Runs symbols one at a time off the shared pool: each build already fans
+    out on the executor, and blocking pool workers on nested builds could starve it.
+    """
+    for sym in symbols:
+        try:
+            build_fullstock(sym, refresh_fin, warming=True)
+        except Exception as e:
+            log.error(f"[WARM ERROR] {sym}: {e}")
+
+
+def _warm_loop(interval):
+    # Caches are cold at boot anyway; the first financials refetch waits a full cycle
+    next_fin = time.monotonic() + WARM_FIN_INTERVAL
+    while True:
+        started = time.monotonic()
+        refresh_fin = started >= next_fin
+        log.info(f"[WARM] {len(HOT_SYMBOLS)} symbols (financials: {refresh_fin})")
+        warm_cache(HOT_SYMBOLS, refresh_fin)
+        if refresh_fin:
+            next_fin = started + WARM_FIN_INTERVAL
+        # Fixed rate: the pass itself counts against the interval
+        time.sleep(max(0, interval - (time.monotonic() - started)))
+
+
+def start_warmer():
+    """Start the background warm loop once per process (gunicorn post_worker_init / dev server)."""
+    global _warm_started
+    if _warm_started or not HOT_SYMBOLS or WARM_INTERVAL <= 0:
+        return
+    _warm_started = True
+    interval = min(WARM_INTERVAL, TTL["quote"] - 60)
+    if interval < WARM_INTERVAL:
+        log.warning(f"[WARM] WARM_INTERVAL={WARM_INTERVAL}s clamped to {interval}s (quote TTL {TTL['quote']}s)")
+    Thread(target=_warm_loop, args=(interval,), name="cache-warmer", daemon=True).start()
 
 
 # ═══════ ROUTES ═══════
 
 @app.route("/")
 def health():
-    return jsonify({
+    return ojsonify({
         "status": "ok",
         "service": "ValueLens API v4",
         "sources": {
@@ -226,7 +480,7 @@ def health():
             "financials": "EODHD" if EODHD_KEY else "Yahoo Finance (INR)",
             "fallback": "Local hardcoded data",
         },
-        "cache_entries": len(cache),
+        "cache_entries": sum(len(c) for c in caches.values()),
         "eodhd_configured": bool(EODHD_KEY),
     })
 
@@ -235,12 +489,12 @@ def health():
 def search():
     q = request.args.get("q", "").strip()
     if not q or len(q) < 2:
-        return jsonify([])
+        return ojsonify([])
 
     ck = f"search:{q.lower()}"
     c = cached(ck, "search")
-    if c:
-        return jsonify(c)
+    if c is not None:
+        return ojsonify(c)
 
     results = search_isma(q)
 
@@ -260,170 +514,148 @@ def search():
         except:
             pass
 
-    set_cache(ck, results)
-    return jsonify(results)
+    set_cache(ck, results, "search", neg=not results)
+    return ojsonify(results)
 
 
 @app.route("/api/fullstock/<symbol>")
 def fullstock(symbol):
-    sym = symbol.upper().replace(".NS", "").replace(".BO", "")
+    sym = clean_sym(symbol)
     ck = f"full:{sym}"
     c = cached(ck, "quote")
-    if c:
-        return jsonify(c)
-
-    # ── LAYER 1: Real-time data from Indian Stock Market API ──
-    isma = fetch_isma(sym)
-
-    # ── LAYER 2: Financial statements (EODHD first, then yfinance) ──
-    fin = fetch_eodhd_financials(sym)
-    fin_source = "eodhd" if fin else None
-
-    if not fin:
-        fin = fetch_yfinance_financials(sym)
-        fin_source = "yfinance" if fin else None
-
-    # ── MERGE ──
-    cmp = isma["cmp"] if isma else 0
-    mcap_raw = isma["mcap_raw"] if isma else 0
-    mcap_cr = mcap_raw / 1e7 if mcap_raw > 1e6 else mcap_raw  # Handle if already in Cr
-    pe = isma["pe"] if isma else 0
-    eps = isma["eps"] if isma else 0
-
-    # Shares: derive from mcap and CMP
-    shr_cr = mcap_cr / cmp if cmp > 0 and mcap_cr > 0 else 0
-
-    # Financial data
-    years = fin["years"] if fin else []
-    latest_rev = years[0]["rev"] if years else 0
-    latest_pat = years[0]["pat"] if years else 0
-
-    result = {
-        "sym": sym,
-        "name": isma["name"] if isma else sym,
-        "sec": isma["sector"] if isma else "Unknown",
-        "industry": isma["industry"] if isma else "",
-        "cmp": cmp,
-        "shr": round(shr_cr, 2),
-        "mcapCr": round(mcap_cr, 0),
-        "pe": pe,
-        "eps": eps,
-        "pat": latest_pat,
-        "rev": latest_rev,
-        "r3": calc_cagr(years, "rev", 3),
-        "r5": calc_cagr(years, "rev", 5),
-        "p3": calc_cagr(years, "pat", 3),
-        "p5": calc_cagr(years, "pat", 5),
-        "dayChange": isma["change"] if isma else 0,
-        "dayChangePct": isma["changePct"] if isma else 0,
-        "yearHigh": isma["yearHigh"] if isma else 0,
-        "yearLow": isma["yearLow"] if isma else 0,
-        "bookValue": isma["bookValue"] if isma else 0,
-        "dividendYield": isma["dividendYield"] if isma else 0,
-        "_source": {
-            "realtime": "isma" if isma else "none",
-            "financials": fin_source or "none",
-            "years_available": len(years),
-        },
+    if c is not None:
+        return ojsonify(c)
+    return ojsonify(build_fullstock(sym))
+
+
+def _batch_row(s):
+    """One /api/batch-quotes row from an ISMA stocks-list entry."""
+    return {
+        "sym": s.get("symbol", ""),
+        "name": s.get("company_name", ""),
+        "cmp": s.get("last_price", 0),
+        "pe": s.get("pe_ratio", 0),
+        "mcapCr": round(s.get("market_cap", 0) / 1e7, 0),
+        "dayChangePct": s.get("percent_change", 0),
     }
 
-    log.info(
-        f"[RESULT] {sym}: CMP={cmp} MCap={round(mcap_cr)}Cr "
-        f"PE={pe} PAT={latest_pat}Cr Rev={latest_rev}Cr "
-        f"({len(years)} yrs from {fin_source or 'none'})"
-    )
-
-    set_cache(ck, result)
-    return jsonify(result)
-
 
 @app.route("/api/batch-quotes", methods=["POST"])
 def batch_quotes():
     symbols = request.json.get("symbols", []) if request.json else []
     if not symbols:
-        return jsonify([])
+        return ojsonify([])
 
-    ck = f"batch:{'_'.join(sorted(symbols[:20]))}"
+    # Normalize + dedupe so equivalent requests share one short cache key
+    norm = sorted({clean_sym(s) for s in symbols})[:20]
+    ck = "batch:" + hashlib.blake2b(",".join(norm).encode(), digest_size=16).hexdigest()
     c = cached(ck, "quote")
-    if c:
-        return jsonify(c)
+    if c is not None:
+        return ojsonify(c)
 
     results = []
     # Use Indian Stock Market API batch endpoint
     try:
-        syms_str = ",".join(s.replace(".NS", "").replace(".BO", "") for s in symbols[:20])
-        url = f"{ISMA_BASE}/stock/list?symbols={syms_str}&res=num"
-        log.info(f"[BATCH] Fetching {len(symbols)} stocks")
-        resp = requests.get(url, timeout=15)
-        if resp.status_code == 200:
-            data = resp.json()
-            stocks = data.get("stocks", [])
-            for s in stocks:
-                results.append({
-                    "sym": s.get("symbol", ""),
-                    "name": s.get("company_name", ""),
-                    "cmp": s.get("last_price", 0),
-                    "pe": s.get("pe_ratio", 0),
-                    "mcapCr": round(s.get("market_cap", 0) / 1e7, 0),
-                    "dayChangePct": s.get("percent_change", 0),
-                })
+        syms_str = ",".join(norm)
+        log.info(f"[BATCH] Fetching {len(norm)} stocks")
+        params = {"symbols": syms_str, "res": "num"}
+        try:
+            with session.get(ISMA_LIST_URL, params=params, timeout=15, stream=True) as resp:
+                if resp.status_code == 200:
+                    # Stream-parse the stocks array instead of loading the whole payload
+                    resp.raw.decode_content = True
+                    for s in ijson.items(resp.raw, "stocks.item", use_float=True):
+                        results.append(_batch_row(s))
+        except ijson.JSONError:
+            # Truncated stream, or NaN/Infinity tokens ijson rejects: refetch once buffered
+            # and use the tolerant parser
+            results = []
+            resp = session.get(ISMA_LIST_URL, params=params, timeout=15)
+            if resp.status_code == 200:
+                results = [_batch_row(s) for s in loads_json(resp.content).get("stocks", [])]
     except Exception as e:
         log.error(f"[BATCH ERROR] {e}")
+        results = []  # drop a half-parsed stream rather than caching it as a hit
 
-    set_cache(ck, results)
-    return jsonify(results)
+    set_cache(ck, results, neg=not results)
+    return ojsonify(results)
 
 
-@app.route("/api/test")
-def test():
-    """Debug endpoint — tests all data sources."""
-    result = {"status": "ok", "sources": {}}
-
-    # Test Indian Stock Market API
+def _probe_isma():
     try:
         isma = fetch_isma("TCS")
-        result["sources"]["isma"] = {
+        return {
             "working": bool(isma and isma["cmp"] > 0),
             "tcs_cmp": isma["cmp"] if isma else 0,
             "tcs_mcap_cr": round(isma["mcap_raw"] / 1e7) if isma else 0,
             "tcs_pe": isma["pe"] if isma else 0,
         }
     except Exception as e:
-        result["sources"]["isma"] = {"working": False, "error": str(e)}
+        return {"working": False, "error": str(e)}
+
 
-    # Test yfinance
+def _probe_yf():
     try:
         t = yf.Ticker("TCS.NS")
         inc = t.financials
         has_data = inc is not None and not inc.empty
-        result["sources"]["yfinance"] = {
+        return {
             "working": has_data,
             "years": len(inc.columns) if has_data else 0,
         }
     except Exception as e:
-        result["sources"]["yfinance"] = {"working": False, "error": str(e)}
+        return {"working": False, "error": str(e)}
 
-    # Test EODHD if configured
-    if EODHD_KEY:
-        try:
-            url = f"https://eodhd.com/api/eod/TCS.NSE?api_token={EODHD_KEY}&fmt=json&limit=1"
-            resp = requests.get(url, timeout=10)
-            result["sources"]["eodhd"] = {
-                "working": resp.status_code == 200,
-                "key_prefix": EODHD_KEY[:5] + "...",
-            }
-        except Exception as e:
-            result["sources"]["eodhd"] = {"working": False, "error": str(e)}
-    else:
-        result["sources"]["eodhd"] = {"configured": False, "note": "Set EODHD_API_KEY env var to enable"}
 
-    return jsonify(result)
+def _probe_eodhd():
+    if not EODHD_KEY:
+        return {"configured": False, "note": "Set EODHD_API_KEY env var to enable"}
+    try:
+        params = {"api_token": EODHD_KEY, "fmt": "json", "limit": 1}
+        resp = session.get(f"{EODHD_BASE}/eod/TCS.NSE", params=params, timeout=10)
+        return {
+            "working": resp.status_code == 200,
+            "key_prefix": EODHD_KEY[:5] + "...",
+        }
+    except Exception as e:
+        return {"working": False, "error": str(e)}
 
 
-# ═══════ START ═══════
+@app.route("/api/test")
+def test():
+    """Debug endpoint — tests all data sources concurrently."""
+    probes = {"isma": _probe_isma, "yfinance": _probe_yf, "eodhd": _probe_eodhd}
+    futs = {k: executor.submit(fn) for k, fn in probes.items()}
+    sources = {}
+    for k, f in futs.items():
+        try:
+            sources[k] = f.result(timeout=FETCH_TIMEOUT)
+        except Exception as e:
+            sources[k] = {"working": False, "error": str(e)}
+    return ojsonify({"status": "ok", "sources": sources})
+
+
+@app.route("/api/warm", methods=["POST"])
+def warm():
+    """Seed the cache for the given symbols (default: HOT_SYMBOLS) in the background."""
+    if not WARM_TOKEN or request.headers.get("X-Warm-Token") != WARM_TOKEN:
+        return ojsonify({"error": "forbidden"}), 403
+    body = request.get_json(silent=True) or {}
+    symbols = body.get("symbols", [])
+    if not isinstance(symbols, list) or not all(isinstance(x, str) for x in symbols):
+        return ojsonify({"error": "symbols must be a list of strings"}), 400
+    if len(symbols) > WARM_MAX_SYMBOLS:
+        return ojsonify({"error": f"at most {WARM_MAX_SYMBOLS} symbols"}), 400
+    symbols = [clean_sym(x) for x in symbols] or HOT_SYMBOLS
+    _warm_executor.submit(warm_cache, symbols, bool(body.get("financials")))
+    return ojsonify({"status": "queued", "symbols": len(symbols)})
+
+
+# ═══════ START (dev only; production runs gunicorn -c gunicorn_conf.py app:app) ═══════
 if __name__ == "__main__":
     log.info(f"\n ValueLens API v4 | Port {PORT}")
     log.info(f"  Realtime: Indian Stock Market API (free, INR)")
     log.info(f"  Financials: {'EODHD' if EODHD_KEY else 'Yahoo Finance'} (INR)")
     log.info(f"  EODHD key: {'YES' if EODHD_KEY else 'NOT SET'}\n")
+    start_warmer()
     app.run(host="0.0.0.0", port=PORT)
@@ -0,0 +1,20 @@
+"""
+Gunicorn settings for ValueLens API.
+The app is I/O-bound (upstream HTTP calls), so threaded workers give far more
+concurrent requests per process than sync workers.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 10000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 32))  # app.py sizes its fetch pool from this too
+keepalive = 30
+timeout = 120
+
+
+def post_worker_init(worker):
+    # Start the cache warmer per worker, after the app has loaded (not at import)
+    from app import start_warmer
+    start_warmer()